@@ -34,13 +34,12 @@ cydc.py:
 
 v1
     This higher-level library controls DIYmall's ESP32-2432S024C, a smaller version of the Cheap Yellow Display but with capacitive touch (CYDc).
-    Touch pin interrupts and gesture data unavailable.
+    Gesture data unavailable. Touch pin interrupt (CTP_INT) is optional, see touch_irq.
     
     TO DO:
         - Implement DAC pin 26 for the speaker instead of using PWM
         - SD card creates a critical error when using keyboard interrupt. Leave sd_enabled = False, unless using it.
         - Implement easy Bluetooth functions
-        - Implement easy Wifi functions
 '''
 
 ######################################################
@@ -87,11 +86,12 @@ IO Pins
 #   Import
 ######################################################
 from ili9341 import Display, color565
-from machine import Pin, SPI, ADC, PWM, SDCard, SoftI2C
+from machine import Pin, SPI, ADC, PWM, I2C, Timer
 import os
 import time
-from math import fabs
+import micropython
 import struct
+import array
 
 
 class CYD(object):
@@ -103,7 +103,21 @@ class CYD(object):
     PURPLE = color565(255,   0, 255)
     WHITE  = color565(255, 255, 255)
     
-    def __init__(self, rgb_pmw=False, speaker_gain=512, sd_enabled = False):
+    # CST820 touch controller I2C address
+    _TOUCH_ADDR = 0x15
+    
+    # Touch register layouts (points, x1, y1[, x2, y2])
+    _TOUCH_FMT1 = '>BHH'
+    _TOUCH_FMT2 = '>BHHHH'
+    _NO_TOUCH1 = (0, 0, 0)
+    _NO_TOUCH2 = (0, 0, 0, 0, 0)
+    
+    # Scales a 16-bit ADC reading to 0.0 - 1.0
+    _INV_U16 = 1.0 / 65535
+    
+    def __init__(self, rgb_pmw=False, speaker_gain=512, sd_enabled = False, display_baudrate=40000000,
+                 touch_irq=False, touch_freq=400000, wifi_ssid=None, wifi_password=None,
+                 speaker_timer=0):
         '''
         Initialize CDY
 
@@ -114,26 +128,61 @@ class CYD(object):
             
             speaker_gain (Default = 512): Sets speaker's volume. The full gain range is 0 - 1023.
 
+            speaker_timer (Default = 0): Hardware timer id (0-3) used by play_tone_async(). It is only claimed the
+                                         first time play_tone_async() runs; pick another id if your code uses timer 0.
+
             sd_enabled (Default = False): Initializes SD Card reader, user still needs to run mount_sd() to access SD card.
+
+            display_baudrate (Default = 40000000): Sets display's SPI clock in Hz. The ESP32 divides its 80 MHz APB clock,
+                                                   so only 80 MHz, 40 MHz, 26.7 MHz, etc. are reachable. Try 80000000 for
+                                                   faster drawing; step back down to 40000000 if artifacts appear.
+
+            touch_irq (Default = False): Uses the touch controller's interrupt pin (CTP_INT, pin 21) so touches() only
+                                         reads the touch controller after it signals new data. The controller is set
+                                         to keep pulsing CTP_INT while a finger is held; between pulses touches()
+                                         reports no touch, so poll no faster than the controller reports. Leave False
+                                         if your board's interrupt line is not working; touches() then polls every call.
+                                         Warning: pin 21 is also the I2C SDA line on connectors P3 and CN1. Enabling
+                                         touch_irq claims it as a pulled-up interrupt input, so don't use it for
+                                         anything else on those connectors.
+
+            touch_freq (Default = 400000): Sets touch controller's I2C clock in Hz. Try 1000000 (Fast-mode Plus) if
+                                           your board's wiring tolerates it.
+
+            wifi_ssid (Default = None): Name of the WIFI network to connect to. WIFI stays off, if None.
+
+            wifi_password (Default = None): Password of the WIFI network.
         '''
-        # Display
-        spi1 = SPI(1, baudrate=40000000, sck=Pin(14), mosi=Pin(13))
+        # Display (HSPI on its IO_MUX pins, which bypasses the slower GPIO matrix)
+        spi1 = SPI(1, baudrate=display_baudrate, polarity=0, phase=0, firstbit=SPI.MSB,
+                   sck=Pin(14), mosi=Pin(13), miso=Pin(12))
         self.display = Display(spi1, dc=Pin(2), cs=Pin(15), rst=Pin(0))
         
         # Backlight
         self.tft_bl = Pin(27, Pin.OUT)
         self.tft_bl.value(1) #Turn on backlight 
         
-        # Touch
-        self._touch = SoftI2C(scl=Pin(32), sda=Pin(33), freq=400000)
+        # Touch (hardware I2C peripheral rather than bit-banged SoftI2C)
+        self._touch = I2C(0, scl=Pin(32), sda=Pin(33), freq=touch_freq)
         #self._touch = CST820(scl=Pin(32), sda=Pin(33), freq=400000, int_pin=21 int_handler=touch_handler)
-        self._touch.writeto_mem(21, 0xfe, b'\xff') # tell it not to sleep
+        self._touch.writeto_mem(self._TOUCH_ADDR, 0xfe, b'\xff') # tell it not to sleep
+        self._touch_buf = bytearray(9)      # Reused by touches() so polling doesn't allocate
+        touch_mv = memoryview(self._touch_buf)
+        self._touch_points = touch_mv[:1]   # Finger count register (0x02)
+        self._touch_xy1 = touch_mv[1:5]     # Finger 1 coordinates (0x03 - 0x06)
+        self._touch_xy2 = touch_mv[1:]      # Finger 1 & 2 coordinates (0x03 - 0x0A)
+        self._touch_irq = False
+        self._touch_pending = False
+        self._touch_callback = None
+        if touch_irq == True:
+            self._setup_touch_irq()
 
         # Boot Button
         self._button_boot = Pin(0, Pin.IN)
         
         # LDR: Light Sensor (Measures Darkness)
         self._ldr = ADC(34)
+        self._ldr_read = self._ldr.read_u16
         
         # RGB LED
         self._rgb_pmw = rgb_pmw
@@ -141,31 +190,45 @@ class CYD(object):
             self.RGBr = Pin(4, Pin.OUT, value=1)     # Red
             self.RGBg = Pin(16, Pin.OUT, value=1)    # Green
             self.RGBb = Pin(17, Pin.OUT, value=1)    # Blue
+            self._rgb_setters = (self.RGBr.value, self.RGBg.value, self.RGBb.value)
         else:
             self.RGBr = PWM(Pin(4), freq=200, duty=1023)     # Red
             self.RGBg = PWM(Pin(16), freq=200, duty=1023)    # Green
             self.RGBb = PWM(Pin(17), freq=200, duty=1023)    # Blue
+            # Brightness (0-255) to duty (1023-0) lookup table, the LED is active-low
+            self._RGB_LUT = array.array('H', (1023 - (v * 1023) // 255 for v in range(256)))
+            self._rgb_setters = (self.RGBr.duty, self.RGBg.duty, self.RGBb.duty)
             print("RGB PMW Ready")
         
         # Speaker
         self._speaker_pin = Pin(26, Pin.OUT)
         self.speaker_gain = int(min(max(speaker_gain, 0),1023))     # Min 0, Max 1023
         self.speaker_pwm = PWM(self._speaker_pin, freq=440, duty=0)
+        self._last_freq = 440           # Skips reconfiguring the PWM timer when the pitch doesn't change
+        self._speaker_timer_id = speaker_timer
+        self._speaker_timer = None      # Created by the first play_tone_async()
             
         # SD Card
         self._sd_ready = False
         self._sd_mounted = False
         if sd_enabled == True:
             try:
+                from machine import SDCard      # Only imported when the SD card reader is used
                 self.sd = SDCard(slot=2)
                 self._sd_ready = True
                 print("SD card ready to mount.")
             except:
                 print("Failed to setup SD Card.") 
+        
+        # WIFI
+        self.wifi = None
+        if wifi_ssid is not None:
+            self.wifi_connect(wifi_ssid, wifi_password)
     
     ######################################################
     #   Touchscreen
     ###################################################### 
+    @micropython.native
     def touches(self, multitouch=False):
         '''
         Get touch data.
@@ -180,15 +243,61 @@ class CYD(object):
             x2: x coordinate of finger 2, if multitouch = True
             y2: y coordinate of finger 2, if multitouch = True
         '''
+        if self._touch_irq == True:
+            if self._touch_pending is False:
+                return self._NO_TOUCH1 if multitouch is False else self._NO_TOUCH2
+            self._touch_pending = False
         if multitouch is False:
-            points, x1, y1 = struct.unpack('>BHH',self._touch.readfrom_mem(0x15, 0x02, 5))
-            return points, x1, y1
-        points, x1, y1, x2, y2 = struct.unpack('>BHHHH',self._touch.readfrom_mem(0x15, 0x02, 9))
-        return points, x1, y1, x2, y2
+            # Read the finger count first and only fetch coordinates when a finger is down
+            self._touch.readfrom_mem_into(self._TOUCH_ADDR, 0x02, self._touch_points)
+            if self._touch_buf[0] == 0:
+                return self._NO_TOUCH1
+            self._touch.readfrom_mem_into(self._TOUCH_ADDR, 0x03, self._touch_xy1)
+            return struct.unpack_from(self._TOUCH_FMT1, self._touch_buf)
+        self._touch.readfrom_mem_into(self._TOUCH_ADDR, 0x02, self._touch_points)
+        if self._touch_buf[0] == 0:
+            return self._NO_TOUCH2
+        self._touch.readfrom_mem_into(self._TOUCH_ADDR, 0x03, self._touch_xy2)
+        return struct.unpack_from(self._TOUCH_FMT2, self._touch_buf)
+    
+    def attach_touch_irq(self, callback):
+        '''
+        Calls a function each time the touch controller signals new touch data. Attaching a function also turns on touch_irq.
+        
+        Args:
+            callback: Function taking one argument, this CYD instance. It runs from the scheduler, not the
+                      interrupt itself, so it may call touches() and draw. None removes the callback and
+                      leaves touch_irq as it is.
+        '''
+        self._touch_callback = callback
+        if callback is not None and self._touch_irq == False:
+            self._setup_touch_irq()
+    
+    def _setup_touch_irq(self):
+        '''
+        Internal function for configuring CTP_INT (pin 21) as a falling edge interrupt.
+        '''
+        # IrqCtl (0xFA): EnTouch (0x40) pulses CTP_INT periodically while touched, EnChange (0x20) on touch changes
+        self._touch.writeto_mem(self._TOUCH_ADDR, 0xFA, b'\x60')
+        self._int_touch = Pin(21, Pin.IN, Pin.PULL_UP)
+        self._int_touch.irq(trigger=Pin.IRQ_FALLING, handler=self._on_touch_irq)
+        self._touch_irq = True
+    
+    def _on_touch_irq(self, pin):
+        '''
+        Internal interrupt handler for CTP_INT. Only flags new touch data; the I2C read happens in touches().
+        '''
+        self._touch_pending = True
+        if self._touch_callback is not None:
+            try:
+                micropython.schedule(self._touch_callback, self)
+            except RuntimeError:
+                pass    # Schedule queue full, touches() still sees the pending flag
     
     ######################################################
     #   RGB LED
     ###################################################### 
+    @micropython.native
     def rgb(self, color):
         '''
         Set RGB LED color.
@@ -196,32 +305,26 @@ class CYD(object):
         Args:
             color: Array containing three int values (r,g,b).
                     if rgb_pmw == False, then static mode is activated.
-                        r (0 or 1): Red brightness.
-                        g (0 or 1): Green brightness.
-                        b (0 or 1): Blue brightness.
+                        r (0 or 1): Red brightness. Any non-zero value is on.
+                        g (0 or 1): Green brightness. Any non-zero value is on.
+                        b (0 or 1): Blue brightness. Any non-zero value is on.
                     if rgb_pmw == True, then dynamic mode is activated.
-                        r (0-255): Red brightness.
-                        g (0-255): Green brightness.
-                        b (0-255): Blue brightness.
+                        r (0-255): Red brightness. Values outside 0-255 are clamped.
+                        g (0-255): Green brightness. Values outside 0-255 are clamped.
+                        b (0-255): Blue brightness. Values outside 0-255 are clamped.
         '''
         r, g, b = color
+        set_r, set_g, set_b = self._rgb_setters
         if self._rgb_pmw == False:
-            self.RGBr.value(1 if min(max(r, 0),1) == 0 else 0)
-            self.RGBg.value(1 if min(max(g, 0),1) == 0 else 0)
-            self.RGBb.value(1 if min(max(b, 0),1) == 0 else 0)
+            set_r(0 if r else 1)      # Active-low, any non-zero value turns the channel on
+            set_g(0 if g else 1)
+            set_b(0 if b else 1)
         else:
-            self.RGBr.duty(int(min(max(self._remap(r,0,255,1023,0), 0),1023)))
-            self.RGBg.duty(int(min(max(self._remap(g,0,255,1023,0), 0),1023)))
-            self.RGBb.duty(int(min(max(self._remap(b,0,255,1023,0), 0),1023)))
-    
-    def _remap(self, value, in_min, in_max, out_min, out_max):
-        '''
-        Internal function for remapping values from one scale to a second.
-        '''
-        in_span = in_max - in_min
-        out_span = out_max - out_min
-        scale = out_span / in_span
-        return out_min + (value - in_min) * scale
+            lut = self._RGB_LUT
+            # Clamp to 0-255 before indexing, int() keeps float brightness values working
+            set_r(lut[int(r) if 0 <= r <= 255 else (0 if r < 0 else 255)])
+            set_g(lut[int(g) if 0 <= g <= 255 else (0 if g < 0 else 255)])
+            set_b(lut[int(b) if 0 <= b <= 255 else (0 if b < 0 else 255)])
     
     ######################################################
     #   Light Sensor
@@ -232,7 +335,7 @@ class CYD(object):
         
         Return: a value from 0.0 to 1.0
         '''
-        return self._ldr.read_u16()/65535
+        return self._ldr_read() * CYD._INV_U16
     
     ######################################################
     #   Button
@@ -246,6 +349,7 @@ class CYD(object):
     ######################################################
     #   Backlight
     ###################################################### 
+    @micropython.native
     def backlight(self, val):
         '''
         Sets TFT Backlight Off/On
@@ -253,7 +357,7 @@ class CYD(object):
         Arg:
             val: 0 or 1 (0 = off/ 1 = on)
         '''
-        self.tft_bl.value(int(min(max(val, 0),1)))
+        self.tft_bl.value(1 if val >= 1 else 0)
         
     ######################################################
     #   Speaker
@@ -267,40 +371,163 @@ class CYD(object):
             duration: How long does the tone play for.
             gain: volume
         '''
-        self.speaker_pwm.freq(freq)
+        self._start_tone(freq, gain)
+        time.sleep_ms(duration)
+        self.speaker_pwm.duty(0)                # Turn off speaker by resetting gain to zero
+    
+    def beep(self, duration=50, gain=0):
+        '''
+        Plays a short tone at the last used frequency (Optional speaker must be attached!)
+        
+        Args:
+            duration (Default = 50): How long does the tone play for (in milliseconds).
+            gain: volume
+        '''
+        self.play_tone(self._last_freq, duration, gain)
+    
+    def play_tone_async(self, freq, duration, gain=0):
+        '''
+        Starts a tone and returns immediately, a timer turns it off after duration (Optional speaker must be attached!)
+        Uses the hardware timer chosen by the speaker_timer argument of CYD().
+        
+        Args:
+            freq: Frequency of the tone.
+            duration: How long does the tone play for (in milliseconds).
+            gain: volume
+        '''
+        if self._speaker_timer is None:
+            self._speaker_timer = Timer(self._speaker_timer_id)
+        self._start_tone(freq, gain)
+        self._speaker_timer.init(mode=Timer.ONE_SHOT, period=duration, callback=self._end_tone)
+    
+    def stop_tone(self):
+        '''
+        Stops any tone and releases the speaker's PWM. The next tone sets it up again.
+        '''
+        if self._speaker_timer is not None:
+            self._speaker_timer.deinit()
+        if self.speaker_pwm is not None:
+            self.speaker_pwm.deinit()
+            self.speaker_pwm = None
+    
+    def _start_tone(self, freq, gain):
+        '''
+        Internal function for turning on the speaker, recreating its PWM after stop_tone().
+        '''
+        if self._speaker_timer is not None:
+            self._speaker_timer.deinit()        # Don't let an earlier play_tone_async() cut this tone short
         if gain == 0:
             gain = self.speaker_gain
+        if self.speaker_pwm is None:
+            self.speaker_pwm = PWM(self._speaker_pin, freq=freq, duty=gain)
+            self._last_freq = freq
+            return
+        if freq != self._last_freq:
+            self.speaker_pwm.freq(freq)
+            self._last_freq = freq
         self.speaker_pwm.duty(gain)             # Turn on speaker by resetting speaker gain
-        time.sleep_ms(duration)
-        self.speaker_pwm.duty(0)                # Turn off speaker by resetting gain to zero
+    
+    def _end_tone(self, timer):
+        '''
+        Internal timer callback for play_tone_async().
+        '''
+        if self.speaker_pwm is not None:
+            self.speaker_pwm.duty(0)
     
     ######################################################
     #   SD Card
     ###################################################### 
     def mount_sd(self):
         '''
-        Mounts SD Card
+        Mounts SD Card. Does nothing if the SD card reader isn't enabled or the card is already mounted.
+        
+        Raises OSError if the card can't be mounted.
         '''
-        try:
-            if self._sd_ready == True:
-                os.mount(self.sd, '/sd')  # mount
-                self._sd_mounted = True
-                print("SD card mounted. Do not remove!")
-        except:
-            print("Failed to mount SD card")
+        if not self._sd_ready or self._sd_mounted:
+            return
+        os.mount(self.sd, '/sd')
+        self._sd_mounted = True
+        print("SD card mounted. Do not remove!")
     
     def unmount_sd(self):
         '''
-        Unmounts SD Card
+        Unmounts SD Card. Does nothing if the SD card isn't mounted.
+        
+        Raises OSError if the card can't be unmounted.
         '''
-        try:
-            if self._sd_mounted == True:
-                os.unmount('/sd')  # mount
-                self._sd_mounted = False
-                print("SD card unmounted. Safe to remove SD card!")
-        except:
-            print("Failed to unmount SD card")
+        if not self._sd_mounted:
+            return
+        os.umount('/sd')
+        self._sd_mounted = False
+        print("SD card unmounted. Safe to remove SD card!")
             
+    ######################################################
+    #   WIFI
+    ######################################################
+    def wifi_connect(self, ssid, password, timeout_ms=15000):
+        '''
+        Connects to a WIFI network. The WIFI driver is only loaded the first time this is called.
+        
+        Args:
+            ssid: Name of the WIFI network.
+            password: Password of the WIFI network.
+            timeout_ms (Default = 15000): How long to wait for a connection (in milliseconds).
+        
+        Return: True if connected, else False
+        '''
+        if self.wifi is None:
+            import network
+            self.wifi = network.WLAN(network.STA_IF)
+            self.wifi.active(True)
+        if self.wifi.isconnected():
+            return True
+        print("Connecting to network...")
+        self.wifi.connect(ssid, password)
+        deadline = time.ticks_add(time.ticks_ms(), timeout_ms)
+        while not self.wifi.isconnected():
+            if time.ticks_diff(deadline, time.ticks_ms()) < 0:
+                self.wifi.disconnect()      # Stop the radio retrying in the background
+                print("Failed to connect to network")
+                return False
+            time.sleep_ms(100)      # Yield instead of spinning while the radio connects
+        print("Connected to network")
+        return True
+    
+    def wifi_isconnected(self):
+        '''
+        Return: True if connected to a WIFI network, else False
+        '''
+        return self.wifi is not None and self.wifi.isconnected()
+    
+    ######################################################
+    #   Display
+    ######################################################
+    def _fill_fast(self, x, y, w, h, color):
+        '''
+        Internal function for filling large rectangles. Sets the display window once, then streams
+        the color in bands of up to 4 KB instead of re-addressing the driver's 1024 pixel (~2 KB) chunks.
+        
+        Args:
+            x, y: Top left corner.
+            w, h: Width and height in pixels.
+            color: RGB565 color value.
+        '''
+        if w <= 0 or h <= 0:
+            return
+        display = self.display
+        rows = min(max(4096 // (w * 2), 1), h)  # Rows per band
+        if color:
+            band = color.to_bytes(2, 'big') * (w * rows)
+        else:
+            band = bytearray(w * 2 * rows)
+        display.block(x, y, x + w - 1, y + h - 1, band)    # Set window and send the first band
+        rows_left = h - rows
+        while rows_left >= rows:
+            display.write_data(band)
+            rows_left -= rows
+        if rows_left > 0:
+            display.write_data(memoryview(band)[:w * 2 * rows_left])
+    
     ######################################################
     #   Shutdown
     ######################################################    
@@ -308,18 +535,19 @@ class CYD(object):
         '''
         Resets CYD and properly shuts down.
         '''
-        self.display.fill_rectangle(0, 0, self.display.width-1, self.display.height-1, self.BLACK)
-        self.display.draw_rectangle(2, 2, self.display.width-5, self.display.height-5, self.RED)
-        self.display.draw_text8x8(self.display.width // 2 - 52, self.display.height // 2 - 4, "Shutting Down", self.WHITE, background=self.BLACK)
-        time.sleep(2.0)
-        self.unmount_sd()
-        self.speaker_pwm.deinit()
-        if self._rgb_pmw == False:
-            self.RGBr.value(1)
-            self.RGBg.value(1)
-            self.RGBb.value(1)
-        else:
-            self.rgb(0,0,0)
-        self.tft_bl.value(0)
-        self.display.cleanup()
-        print("========== Goodbye ==========")
+        display = self.display
+        w = display.width
+        h = display.height
+        self._fill_fast(0, 0, w, h, self.BLACK)
+        display.draw_rectangle(2, 2, w-5, h-5, self.RED)
+        display.draw_text8x8(w // 2 - 52, h // 2 - 4, "Shutting Down", self.WHITE, background=self.BLACK)
+        time.sleep_ms(2000)
+        try:
+            self.unmount_sd()
+        finally:
+            # Finish the teardown even if the SD card fails to unmount, then let the error through
+            self.stop_tone()
+            self.rgb((0, 0, 0))
+            self.tft_bl.value(0)
+            display.cleanup()
+            print("========== Goodbye ==========")
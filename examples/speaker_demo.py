@@ -14,20 +14,20 @@ cyd.display.fill_rectangle(0, 0, cyd.display.width-1, cyd.display.height-1, cyd.
 
 
 duration = 500    # How long to play each note. (in milliseconds)
-pause = 2.0       # How long to pause inbetween each tone. (in seconds)
+pause = 2000      # How long to pause inbetween each tone. (in milliseconds)
 
 # Play tone 1
 print("Playing Tone 1")
 cyd.display.draw_text8x8(cyd.display.width // 2 - 56, cyd.display.height // 2 - 4, "Playing Tone 1", cyd.WHITE, background=cyd.BLUE)
 
 cyd.play_tone(220, duration)  # A4 Tone
-time.sleep(pause)
+time.sleep_ms(pause)
 
 # Play tone 2
 print("Playing Tone 2")
 cyd.display.draw_text8x8(cyd.display.width // 2 - 56, cyd.display.height // 2 - 4, "Playing Tone 2", cyd.WHITE, background=cyd.BLUE)
 
 cyd.play_tone(440, duration)  # C5 Tone
-time.sleep(pause)
+time.sleep_ms(pause)
         
 cyd.shutdown()
\ No newline at end of file
@@ -20,32 +20,37 @@ colors = [cyd.RED, cyd.GREEN, cyd.BLUE]
 c = 0    # Initial color choice
 r = 4    # Radius of cirlces
 
+# Screen limits that keep circles on-screen. These never change, so work them out once.
+x_flip = cyd.display.width - 1     # Touch x runs opposite to display x
+y_flip = cyd.display.height - 1    # Touch y runs opposite to display y
+xy_min = r + 1
+x_max = cyd.display.width - (r + 1)
+y_max = cyd.display.height - (r + 1)
+
 while True:
-    time.sleep(0.05)
+    time.sleep_ms(50)
     fingers, raw_x, raw_y = cyd.touches()
     print("Touches:",fingers, raw_x, raw_y)
 
-    if fingers is 0:
+    if fingers == 0:
         # No Fingers Detected
         longpress_flag = False
-        continue
     
-    if fingers is 2:
+    elif fingers == 2:
         if longpress_flag == True:
             # Two-Finger Long Press Action - Works best When fingers are far apart.
             break
         # Two-Finger Tap Action - Works best when fingers are far apart
         longpress_flag = True
         c=(c+1)%len(colors)
-        time.sleep(0.1)
-        continue
+        time.sleep_ms(100)
     
-    if fingers is 1:
+    elif fingers == 1:
         # One Finger Tap Action
         longpress_flag = False
         # Prevent circles from appearing off-screen.
-        y = min(max(((cyd.display.height - 1) - raw_y), (r+1)),(cyd.display.height-(r+1)))
-        x = min(max(((cyd.display.width - 1) - raw_x), (r+1)),(cyd.display.width-(r+1)))
+        y = min(max((y_flip - raw_y), xy_min), y_max)
+        x = min(max((x_flip - raw_x), xy_min), x_max)
         # Create circle
         cyd.display.fill_circle(x, y, r, colors[c])
 
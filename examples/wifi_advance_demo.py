@@ -7,8 +7,6 @@
 
 from cydc import CYD
 import time
-import network
-import urequests
 
 # Create an instance of CYD with WIFI support
 ssid = "PoolHouse"         # The name of the WIFI network you want to connect to.
@@ -16,36 +14,48 @@ password = "2636LakeView" # The password of the WIFI network you want to connect
 
 cyd = CYD()
 
+# Screen center, used to center text (each character is 8 pixels wide, so half a line is len(text) * 4)
+w2 = cyd.display.width // 2
+h2 = cyd.display.height // 2
+
+text = "You are in:"
+cyd.display.draw_text8x8(w2 - len(text) * 4, h2 - 16, text, cyd.WHITE)
+
+# Load the network modules after the screen is drawn, so the first pixels appear sooner.
+import network
+import urequests
+
 # Create a WIFI interface.
 wifi = network.WLAN(network.STA_IF)
 wifi.active(True)
 
-text = "You are in:"
-cyd.display.draw_text8x8(cyd.display.width // 2 - int((len(text)*8)/2), cyd.display.height // 2 - 16, text, cyd.WHITE)
-
 url = "http://ip-api.com/json/"
 
-end_time = 0
+end_time = time.ticks_ms()    # Request the first update right away
 
 while not wifi.isconnected():
 
     #Attempt to connect to WIFI network
     print("Connecting to network...")
     wifi.connect(ssid, password)
-    time.sleep(0.1)
+    time.sleep_ms(100)
     
 while wifi.isconnected():    
-    if time.ticks_ms() > end_time:
+    now = time.ticks_ms()
+    # ticks_ms() wraps around, so compare with ticks_diff() instead of >
+    if time.ticks_diff(now, end_time) >= 0:
         r = urequests.get(url).json()
         #print(r)    # Uncomment to print all data.
         text = str(r['city'])
         
         # draw text
-        cyd.display.draw_text8x8(cyd.display.width // 2 - int((len(text)*8)/2), cyd.display.height // 2 - 4, text, cyd.WHITE)
+        cyd.display.draw_text8x8(w2 - len(text) * 4, h2 - 4, text, cyd.WHITE)
         
         # reset end_time
         # We don't want to overburden the server and the CYD with requests so we request updates every 3 minutes.
         # This method also allows the other functions like the touch function to work in the background.
-        end_time = time.ticks_ms() + 180000   # 60000ms = 1 minute
+        end_time = time.ticks_add(now, 180000)   # 60000ms = 1 minute
+    
+    time.sleep_ms(100)    # Yield to WIFI and other tasks between checks
     
 cyd.shutdown()
@@ -7,29 +7,40 @@
 
 from cydc import CYD
 import time
-import urequests
 
 # Create an instance of CYD with WIFI support
 ssid = "PoolHouse"     # The name of the WIFI network you want to connect to.
 password = "2636LakeView" # The password of the WIFI network you want to connect to.
 
 cyd = CYD(wifi_ssid=ssid, wifi_password=password)
+
+# Load urequests only after the display and WIFI are up.
+import urequests
+
 url = "http://api.coindesk.com/v1/bpi/currentprice.json"
 
-end_time = 0
+# Screen center, used to center text (each character is 8 pixels wide, so half a line is len(text) * 4)
+w2 = cyd.display.width // 2
+h2 = cyd.display.height // 2
+
+end_time = time.ticks_ms()    # Request the first update right away
 
 while cyd.wifi_isconnected():    
-    if time.ticks_ms() > end_time:
+    now = time.ticks_ms()
+    # ticks_ms() wraps around, so compare with ticks_diff() instead of >
+    if time.ticks_diff(now, end_time) >= 0:
         r = urequests.get(url).json()
         print(r['bpi']['USD']['rate_float'])
         text = "B " + str(r['bpi']['USD']['rate_float'])
         
         # draw text
-        cyd.display.draw_text8x8(cyd.display.width // 2 - 40, cyd.display.height // 2 - 4, text, cyd.WHITE)
+        cyd.display.draw_text8x8(w2 - len(text) * 4, h2 - 4, text, cyd.WHITE)
         
         # reset end_time
         # We don't want to overburden the server and the CYD with requests so we request updates every 3 minutes.
-        end_time = time.ticks_ms() + 180000   # 60000ms = 1 minute
+        end_time = time.ticks_add(now, 180000)   # 60000ms = 1 minute
+    
+    time.sleep_ms(100)    # Yield to WIFI and other tasks between checks
 
 cyd.shutdown()
 